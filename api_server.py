@@ -1,136 +1,115 @@
 import datetime
 import glob
-import json
 import os
-from typing import Optional
+import re
+import threading
+from pathlib import Path
+from typing import Any, Optional
 
-from anthropic import Anthropic
+import gevent
+import orjson
 from anthropic.types import MessageParam
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request, send_from_directory
+from flask import (
+    Flask,
+    Response,
+    jsonify,
+    request,
+    send_from_directory,
+    stream_with_context,
+)
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 
 import config
+from llm_client import LLMClient, create_llm_client, get_llm_backend
 from ner_extractor import NERExtractor
-from pro_ctcae_mapper import ProCtcaeMapper
-from session_manager import ConversationSession, SessionManager
+from session_manager import SessionManager, iso_timestamp
+from tasks import (
+    generate_summary_job,
+    get_summary_queue,
+    summary_job_failed,
+    summary_job_id,
+)
+
+# Phrase the assistant uses to close the conversation (see config.SYSTEM_PROMPT)
+_END_MARKER_RE = re.compile(r"i have everything i need", re.IGNORECASE)
 
 # Initialize global components
 load_dotenv()
 session_manager = SessionManager()
-anthropic_client: Optional[Anthropic] = None
+summary_queue = get_summary_queue()
+chat_client: Optional[LLMClient] = None
 ner_client: Optional[NERExtractor] = None
-pro_ctcae_mapper: Optional[ProCtcaeMapper] = None
+_services_initialized = False
+
+# One NER call at a time per worker: the entity cache and the fast tokenizer
+# aren't thread-safe, and torch already spreads a forward pass across cores.
+# Under gevent workers threading is patched, so waiters yield to other greenlets
+_ner_lock = threading.Lock()
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson for jsonify and request.get_json"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return orjson.loads(s)
 
-# Initialize Flask app
-app = Flask(__name__, static_folder="static", static_url_path="")
-CORS(app, origins=os.environ.get("ALLOWED_HOSTS"), supports_credentials=True)
+
+class RaecerFlask(Flask):
+    json_provider_class = OrjsonProvider
+
+
+# Initialize Flask app. The built Svelte app is served by the routes at the
+# bottom of this file rather than Flask's static route, so unknown paths can
+# fall back to index.html
+app = RaecerFlask(__name__, static_folder=None)
+# Comma-separated list of allowed CORS origins; all origins when unset
+ALLOWED_ORIGINS = [
+    origin.strip()
+    for origin in os.environ.get("ALLOWED_HOSTS", "").split(",")
+    if origin.strip()
+]
+CORS(app, origins=ALLOWED_ORIGINS or "*", supports_credentials=True)
 
 
 def initialize_services():
-    """Initialize OpenAI, NER, and PRO-CTCAE services"""
-    global anthropic_client, ner_client, pro_ctcae_mapper
+    """Initialize LLM and NER services"""
+    global chat_client, ner_client
 
     try:
-        anthropic_client = Anthropic()
-        print("✅ Anthropic client initialized")
+        chat_client = create_llm_client()
+        print(f"✅ LLM client initialized ({get_llm_backend()})")
     except Exception as e:
-        print(f"❌ Error initializing Anthropic client: {e}")
+        print(f"❌ Error initializing LLM client: {e}")
         raise
 
     try:
-        ner_client = NERExtractor(model_name=config.NER_MODEL_NAME)
+        ner_client = NERExtractor(
+            model_name=config.NER_MODEL_NAME,
+            onnx_dir=config.NER_ONNX_DIR,
+            num_threads=config.NER_NUM_THREADS,
+        )
         print("✅ NER client initialized")
     except Exception as e:
         print(f"❌ Error initializing NER client: {e}")
         raise
 
-    try:
-        pro_ctcae_mapper = ProCtcaeMapper()
-        print("✅ PRO-CTCAE mapper initialized")
-    except Exception as e:
-        print(f"❌ Error initializing PRO-CTCAE mapper: {e}")
-        raise
-
 
-def generate_summary(
-    session: ConversationSession,
-) -> tuple[Optional[dict], Optional[dict], Optional[str]]:
+def _extract_entities(text: str) -> dict:
     """
-    Generate patient summary and PRO-CTCAE mapping from conversation history
-    Returns: (patient_data, pro_ctcae_data, error_message)
+    Run NER on a native thread from the gevent hub's threadpool
+    The forward pass is CPU-bound; run inline, it would block the hub and stall
+    every other request and SSE stream in the worker
     """
-    try:
-        if not anthropic_client:
-            raise ValueError("Anthropic client not initialized")
-
-        if not pro_ctcae_mapper:
-            raise ValueError("PRO-CTCAE mapper not initialized")
-
-        # Add the extraction prompt
-        extraction_message: MessageParam = {
-            "role": "user",
-            "content": config.JSON_EXTRACTION_PROMPT,
-        }
-        conversation_history = session.messages + [extraction_message]
-
-        # Get summary from Anthropic
-        response = anthropic_client.messages.create(
-            model=config.CONVERSATIONAL_MODEL,
-            messages=conversation_history,
-            max_tokens=2048,
-            system=config.SYSTEM_PROMPT,
-        )
-
-        # Extract text from Anthropic response
-        if not response.content:
-            return None, None, "Model returned no content"
-
-        first_block = response.content[0]
-        if not hasattr(first_block, "text"):
-            return None, None, "Model response did not contain text content"
+    if not (ner_client and ner_client.pipeline):
+        return {}
 
-        message_content = str(first_block.text)
-
-        # Parse JSON
-        cleaned_json_string = (
-            message_content.strip().replace("```json", "").replace("```", "")
-        )
-        patient_data = json.loads(cleaned_json_string)
-
-        # Save patient data to file
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        os.makedirs("data", exist_ok=True)
-
-        file_name = f"data/patient_summary_{timestamp}.json"
-        with open(file_name, "w") as f:
-            json.dump(patient_data, f, indent=4)
-
-        # Generate PRO-CTCAE mapping
-        pro_ctcae_data = None
-        entries = pro_ctcae_mapper.parse_patient_json(file_name)
-
-        if entries:
-            ehr_data = pro_ctcae_mapper.format_for_ehr_entry(entries)
-            ehr_data["source_file"] = file_name
-            ehr_data["assessment_date"] = timestamp
-
-            clinical_summary = pro_ctcae_mapper.generate_clinical_summary(entries)
-            ehr_data["clinical_summary"] = clinical_summary
-
-            # Save PRO-CTCAE file
-            pro_ctcae_file = f"data/pro_ctcae_{timestamp}.json"
-            with open(pro_ctcae_file, "w") as f:
-                json.dump(ehr_data, f, indent=2)
-
-            pro_ctcae_data = ehr_data
-
-        return patient_data, pro_ctcae_data, None
-
-    except json.JSONDecodeError as e:
-        return None, None, f"Could not parse JSON: {str(e)}"
-    except Exception as e:
-        return None, None, f"Error generating summary: {str(e)}"
+    with _ner_lock:
+        return gevent.get_hub().threadpool.apply(ner_client.extract_entities, (text,))
 
 
 # ==================== API Routes ====================
@@ -142,11 +121,10 @@ def health_check():
     return jsonify(
         {
             "status": "healthy",
-            "timestamp": datetime.datetime.now().isoformat(),
+            "timestamp": iso_timestamp(),
             "services": {
-                "openai": anthropic_client is not None,
+                "llm": chat_client is not None,
                 "ner": ner_client is not None and ner_client.pipeline is not None,
-                "pro_ctcae": pro_ctcae_mapper is not None,
             },
         }
     )
@@ -216,9 +194,7 @@ def send_message(session_id: str):
         user_input = data["message"]
 
         # Extract entities using NER
-        extracted_entities = {}
-        if ner_client and ner_client.pipeline:
-            extracted_entities = ner_client.extract_entities(user_input)
+        extracted_entities = _extract_entities(user_input)
 
         # Add user message to session
         user_message: MessageParam = {
@@ -227,28 +203,11 @@ def send_message(session_id: str):
         }
         session_manager.append_message(session, user_message)
 
-        # Get bot response from Anthropic
-        if not anthropic_client:
-            raise ValueError("Anthropic client not initialized")
-
-        response = anthropic_client.messages.create(
-            model=config.CONVERSATIONAL_MODEL,
-            messages=session.messages,
-            max_tokens=1024,
-            system=config.SYSTEM_PROMPT,
-        )
-
-        # Extract text from Anthropic response
-        if not response.content:
-            return jsonify({"error": "Model returned no response"}), 500
-
-        first_block = response.content[0]
-        if not hasattr(first_block, "text"):
-            return jsonify(
-                {"error": "Model response did not contain text content"}
-            ), 500
+        # Get bot response from the model
+        if not chat_client:
+            raise ValueError("LLM client not initialized")
 
-        bot_response = str(first_block.text)
+        bot_response = chat_client.complete(session.messages, max_tokens=1024)
 
         # Add bot message to session
         bot_message: MessageParam = {
@@ -258,7 +217,7 @@ def send_message(session_id: str):
         session_manager.append_message(session, bot_message)
 
         # Check if conversation should end
-        conversation_ended = "i have everything i need" in bot_response.lower()
+        conversation_ended = _END_MARKER_RE.search(bot_response) is not None
 
         return jsonify(
             {
@@ -274,12 +233,104 @@ def send_message(session_id: str):
         return jsonify({"error": str(e)}), 500
 
 
+def _sse_event(payload: dict) -> str:
+    """Format a payload as a single Server-Sent Event"""
+    return f"data: {orjson.dumps(payload).decode()}\n\n"
+
+
+@app.route("/api/conversation/<session_id>/message/stream", methods=["POST"])
+def stream_message(session_id: str):
+    """
+    Send a message and stream the bot's response as Server-Sent Events
+
+    Request body:
+        message: The user's message text
+
+    Events:
+        {"delta": ...} for each chunk of response text, followed by a final
+        {"done": true, "entities": ..., "conversation_ended": ..., "message_count": ...}
+        or {"error": ...} if generation fails
+    """
+    session = session_manager.get_session(session_id)
+    if not session:
+        return jsonify({"error": "Session not found"}), 404
+
+    if session.status != "active":
+        return jsonify({"error": f"Session is {session.status}, not active"}), 400
+
+    data = request.get_json()
+    if not data or "message" not in data:
+        return jsonify({"error": "Message is required"}), 400
+
+    client = chat_client
+    if not client:
+        return jsonify({"error": "LLM client not initialized"}), 500
+
+    user_input = data["message"]
+
+    # Extract entities using NER
+    extracted_entities = _extract_entities(user_input)
+
+    user_message: MessageParam = {
+        "role": "user",
+        "content": user_input,
+    }
+    session_manager.append_message(session, user_message)
+
+    def generate():
+        chunks: list[str] = []
+        finished = False
+        try:
+            for text in client.stream(session.messages, max_tokens=1024):
+                chunks.append(text)
+                yield _sse_event({"delta": text})
+            finished = True
+        except Exception as e:
+            session_manager.update_session(
+                session_id, status="error", error_message=str(e)
+            )
+            yield _sse_event({"error": str(e)})
+        finally:
+            # Save the response even if the client disconnected mid-stream
+            # (GeneratorExit), so the history never ends on an unanswered
+            # user turn
+            if chunks:
+                bot_message: MessageParam = {
+                    "role": "assistant",
+                    "content": "".join(chunks),
+                }
+                session_manager.append_message(session, bot_message)
+
+        if not finished:
+            return
+
+        bot_response = "".join(chunks)
+        yield _sse_event(
+            {
+                "done": True,
+                "entities": extracted_entities,
+                "conversation_ended": _END_MARKER_RE.search(bot_response) is not None,
+                "message_count": len(session.messages),
+            }
+        )
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.route("/api/conversation/<session_id>/end", methods=["POST"])
 def end_conversation(session_id: str):
     """
-    End a conversation and generate the final summary
+    End a conversation and queue generation of the final summary
 
-    Returns:
+    Returns (202):
+        task_id: ID of the background summary job
+        status: "generating" - poll /api/conversation/<session_id>/status
+
+    Returns (200, already completed):
         patient_data: Structured patient information
         pro_ctcae_data: PRO-CTCAE mapping (if applicable)
     """
@@ -298,26 +349,19 @@ def end_conversation(session_id: str):
                 }
             ), 200
 
-        # Generate summary
-        patient_data, pro_ctcae_data, error_message = generate_summary(session)
+        task_id = summary_job_id(session_id)
 
-        if error_message:
-            session_manager.update_session(
-                session_id, status="error", error_message=error_message
+        # Only the request that claims the session enqueues, so concurrent
+        # calls can't queue the job twice
+        if session_manager.start_summary(session_id):
+            summary_queue.enqueue(
+                generate_summary_job,
+                session_id,
+                job_id=task_id,
+                on_failure=summary_job_failed,
             )
-            return jsonify({"error": error_message}), 500
-
-        # Update session
-        session_manager.update_session(
-            session_id,
-            status="completed",
-            patient_data=patient_data,
-            pro_ctcae_data=pro_ctcae_data,
-        )
 
-        return jsonify(
-            {"patient_data": patient_data, "pro_ctcae_data": pro_ctcae_data}
-        ), 200
+        return jsonify({"task_id": task_id, "status": "generating"}), 202
 
     except Exception as e:
         session_manager.update_session(session_id, status="error", error_message=str(e))
@@ -341,18 +385,13 @@ def get_conversation_history(session_id: str):
     if not session:
         return jsonify({"error": "Session not found"}), 404
 
-    # Filter out system messages for cleaner output
-    messages = [
-        {"role": msg["role"], "content": msg["content"]}
-        for msg in session.messages
-        if msg["role"] != "system"
-    ]
-
+    # Sessions never hold system messages (the system prompt is passed
+    # separately to the model), so the stored list is returned as-is
     return jsonify(
         {
             "session_id": session.session_id,
             "status": session.status,
-            "messages": messages,
+            "messages": session.messages,
         }
     ), 200
 
@@ -505,10 +544,9 @@ def get_data_file_content(filename: str):
         return jsonify({"error": "File not found"}), 404
 
     try:
-        with open(filepath, "r") as f:
-            content = json.load(f)
+        content = orjson.loads(Path(filepath).read_bytes())
         return jsonify({"filename": filename, "content": content}), 200
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         return jsonify({"error": "File is not valid JSON"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -526,7 +564,8 @@ def api_docs():
                 "GET /api/health": "Health check",
                 "POST /api/conversation/start": "Start a new conversation",
                 "POST /api/conversation/<session_id>/message": "Send a message",
-                "POST /api/conversation/<session_id>/end": "End conversation and get summary",
+                "POST /api/conversation/<session_id>/message/stream": "Send a message and stream the response (SSE)",
+                "POST /api/conversation/<session_id>/end": "End conversation and queue summary generation",
                 "GET /api/conversation/<session_id>/status": "Get conversation status",
                 "GET /api/conversation/<session_id>/history": "Get conversation history",
                 "DELETE /api/conversation/<session_id>": "Delete a conversation",
@@ -542,31 +581,63 @@ def api_docs():
 
 # ==================== Static File Serving ====================
 
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+# Vite emits content-hashed file names under assets/, so they never change
+STATIC_ASSET_PREFIX = "assets/"
+STATIC_ASSET_MAX_AGE = 31536000  # One year
+
+
+def _list_static_files() -> frozenset[str]:
+    """Relative paths of all files in the built frontend, collected at startup"""
+    static_files = set()
+    for root, _, filenames in os.walk(STATIC_DIR):
+        relative_root = os.path.relpath(root, STATIC_DIR)
+        for filename in filenames:
+            path = os.path.normpath(os.path.join(relative_root, filename))
+            static_files.add(path.replace(os.sep, "/"))
+    return frozenset(static_files)
+
+
+STATIC_FILES = _list_static_files()
+
 
 @app.route("/")
 def serve_app():
     """Serve the Svelte app"""
-    if app.static_folder is None:
+    if "index.html" not in STATIC_FILES:
         return jsonify({"error": "Static folder not configured"}), 500
-    return send_from_directory(app.static_folder, "index.html")
+    return send_from_directory(STATIC_DIR, "index.html")
 
 
 @app.route("/<path:path>")
 def serve_static(path):
     """Serve static files, fallback to index.html for SPA routing"""
-    if app.static_folder is None:
-        return jsonify({"error": "Static folder not configured"}), 500
-    if os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    return send_from_directory(app.static_folder, "index.html")
+    if path not in STATIC_FILES:
+        return serve_app()
+
+    if path.startswith(STATIC_ASSET_PREFIX):
+        response = send_from_directory(STATIC_DIR, path, max_age=STATIC_ASSET_MAX_AGE)
+        response.cache_control.immutable = True
+        return response
+
+    return send_from_directory(STATIC_DIR, path)
 
 
 # ==================== Application Startup ====================
 
 
 def create_app():
-    """Factory function for production"""
-    initialize_services()
+    """
+    Factory function for production
+    gunicorn calls this once in each worker process; the services (including
+    the NER model) are only loaded the first time
+    """
+    global _services_initialized
+
+    if not _services_initialized:
+        initialize_services()
+        _services_initialized = True
     return app
 
 
@@ -580,4 +651,4 @@ if __name__ == "__main__":
     print("📚 API documentation available at http://localhost:8000/api/docs")
     print("\nPress CTRL+C to stop the server\n")
     print("=" * 60)
-    app.run(host="0.0.0.0", port=8000, debug=True)
+    app.run(host="0.0.0.0", port=8000, debug=os.environ.get("FLASK_DEBUG") == "1")
@@ -1,28 +1,53 @@
 import os
-import json
 import datetime
+import threading
+from concurrent.futures import Future
+import orjson
 from openai import OpenAI
 from openai.types.chat import ChatCompletionMessageParam
 from ner_extractor import NERExtractor
 from pro_ctcae_mapper import ProCtcaeMapper
+from llm_client import create_openai_client
 import config
+import data_writer
 from dotenv import load_dotenv
 
 
-def initialize_clients():
-    """Initializes and returns the OpenAI client and NER extractor."""
+def _load_ner_extractor(future: "Future[NERExtractor]") -> None:
+    """Loads the NER extractor and resolves the future with it or with the error."""
+    try:
+        extractor = NERExtractor(
+            model_name=config.NER_MODEL_NAME,
+            onnx_dir=config.NER_ONNX_DIR,
+            num_threads=config.NER_NUM_THREADS,
+        )
+    except BaseException as exc:
+        future.set_exception(exc)
+    else:
+        future.set_result(extractor)
+
+
+def initialize_clients() -> tuple[OpenAI, "Future[NERExtractor]", ProCtcaeMapper]:
+    """Initializes the OpenAI client and PRO-CTCAE mapper, and starts loading the NER extractor."""
     try:
         load_dotenv()
-        openai_client = OpenAI()  # Looks for OPENAI_API_KEY environment variable
+        # Looks for OPENAI_API_KEY environment variable
+        openai_client = create_openai_client()
     except Exception:  # Fixed: Removed unused variable 'e'
         print(
             "Error: OpenAI API key not configured. Please set the OPENAI_API_KEY environment variable."
         )
         exit()
 
-    ner_client = NERExtractor(model_name=config.NER_MODEL_NAME)
+    # Load the NER model in the background while the user reads the greeting and types.
+    # A daemon thread, so quitting before the model is ready doesn't wait for the load.
+    ner_future: "Future[NERExtractor]" = Future()
+    threading.Thread(
+        target=_load_ner_extractor, args=(ner_future,), name="ner-loader", daemon=True
+    ).start()
+
     pro_ctcae_mapper = ProCtcaeMapper()
-    return openai_client, ner_client, pro_ctcae_mapper
+    return openai_client, ner_future, pro_ctcae_mapper
 
 
 def summarize_and_save(
@@ -43,9 +68,11 @@ def summarize_and_save(
     json_string = ""  # Fixed: Initialize json_string to avoid unbound variable error
     try:
         response = openai_client.chat.completions.create(
-            model=config.CONVERSATIONAL_MODEL,
+            model=config.CONVERSATIONAL_MODELS["openai"],
             messages=conversation_history,
             temperature=0.0,  # Low temperature for factual, deterministic output
+            # JSON mode: always a bare JSON object
+            response_format={"type": "json_object"},
         )
 
         # Fixed: Handle potential None value from response
@@ -55,12 +82,7 @@ def summarize_and_save(
             return
 
         json_string = message_content
-
-        # Clean the string in case the model adds markdown backticks
-        cleaned_json_string = (
-            json_string.strip().replace("```json", "").replace("```", "")
-        )
-        patient_data = json.loads(cleaned_json_string)
+        patient_data = orjson.loads(json_string)
 
         # Save the data
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -69,16 +91,17 @@ def summarize_and_save(
         # Ensure the 'data' directory exists
         os.makedirs("data", exist_ok=True)
 
-        with open(file_name, "w") as f:
-            json.dump(patient_data, f, indent=4)
+        # Written in the background while the summary is printed and mapped
+        summary_write = data_writer.write_in_background(
+            file_name, orjson.dumps(patient_data, option=orjson.OPT_INDENT_2)
+        )
 
-        print(f"\n✅ Success! Patient summary saved to '{file_name}'.")
         print("\n--- Summary Data ---")
-        print(json.dumps(patient_data, indent=4))
+        print(orjson.dumps(patient_data, option=orjson.OPT_INDENT_2).decode())
 
         # Map to PRO-CTCAE codes
         print("\n--- Mapping to PRO-CTCAE ---")
-        entries = pro_ctcae_mapper.parse_patient_json(file_name)
+        entries = pro_ctcae_mapper.parse_patient_dict(patient_data)
 
         if entries:
             ehr_data = pro_ctcae_mapper.format_for_ehr_entry(entries)
@@ -91,28 +114,55 @@ def summarize_and_save(
 
             # Save PRO-CTCAE formatted file
             pro_ctcae_file = f"data/pro_ctcae_{timestamp}.json"
-            with open(pro_ctcae_file, "w") as f:
-                json.dump(ehr_data, f, indent=2)
+            pro_ctcae_write = data_writer.write_in_background(
+                pro_ctcae_file, orjson.dumps(ehr_data, option=orjson.OPT_INDENT_2)
+            )
 
-            print(f"\n✅ PRO-CTCAE mapping saved to '{pro_ctcae_file}'.")
             print(clinical_summary)
         else:
+            pro_ctcae_write = None
             print("No symptoms found for PRO-CTCAE mapping.")
 
-    except json.JSONDecodeError:
+        # Only report files once their writes have finished; a failed write is
+        # logged by data_writer instead
+        if summary_write.exception() is None:
+            print(f"\n✅ Success! Patient summary saved to '{file_name}'.")
+        if pro_ctcae_write and pro_ctcae_write.exception() is None:
+            print(f"✅ PRO-CTCAE mapping saved to '{pro_ctcae_file}'.")
+
+    except orjson.JSONDecodeError:
         print("\nError: Could not parse the JSON output from the model.")
         print("Model Output was:\n", json_string)
     except Exception as e:
         print(f"\nAn error occurred during final summary generation: {e}")
 
 
+def summarize_older_turns(
+    openai_client: OpenAI,
+    history_summary: str,
+    older_turns: list[ChatCompletionMessageParam],
+) -> str:
+    """Folds turns that left the context window into the running summary."""
+    transcript = "\n".join(
+        f"{turn['role']}: {turn.get('content')}" for turn in older_turns
+    )
+    previous_summary = history_summary or "(none)"
+    request = f"Summary so far:\n{previous_summary}\n\nNew turns:\n{transcript}"
+    response = openai_client.chat.completions.create(
+        model=config.HISTORY_SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": config.HISTORY_SUMMARY_PROMPT},
+            {"role": "user", "content": request},
+        ],
+        temperature=0.0,
+    )
+    return response.choices[0].message.content or history_summary
+
+
 def run_conversation():
     """Main function to run the chatbot conversation."""
-    openai_client, ner_client, pro_ctcae_mapper = initialize_clients()
-
-    if ner_client.pipeline is None:
-        print("Could not start conversation due to NER model loading failure.")
-        return
+    openai_client, ner_future, pro_ctcae_mapper = initialize_clients()
+    ner_client: NERExtractor | None = None
 
     # Fixed: Properly type messages list for OpenAI API
     messages: list[ChatCompletionMessageParam] = [
@@ -128,6 +178,11 @@ def run_conversation():
     }
     messages.append(assistant_message)
 
+    # Turns before summarized_until are covered by history_summary and left out of
+    # each request; the full history is kept for the final summary
+    history_summary = ""
+    summarized_until = 1
+
     while True:
         user_input = input("You: ")
 
@@ -135,6 +190,15 @@ def run_conversation():
             break
 
         # --- Real-time Entity Extraction with ClinicalBERT ---
+        # The first turn waits for the background model load to finish
+        if ner_client is None:
+            ner_client = ner_future.result()
+            if ner_client.pipeline is None:
+                print(
+                    "Could not continue conversation due to NER model loading failure."
+                )
+                return
+
         extracted_entities = ner_client.extract_entities(user_input)
         if extracted_entities:
             print(f"🧠 ClinicalBERT Entities Detected: {extracted_entities}")
@@ -147,19 +211,48 @@ def run_conversation():
         }
         messages.append(user_message)
 
-        # Get conversational response from GPT-4
+        # Get conversational response from GPT-4, printing it as it streams in
         try:
-            response = openai_client.chat.completions.create(
-                model=config.CONVERSATIONAL_MODEL, messages=messages
+            # Once the window is full, fold its older half into the running summary
+            if len(messages) - summarized_until > config.CONTEXT_WINDOW_MESSAGES:
+                window_start = len(messages) - config.CONTEXT_WINDOW_MESSAGES // 2
+                history_summary = summarize_older_turns(
+                    openai_client,
+                    history_summary,
+                    messages[summarized_until:window_start],
+                )
+                summarized_until = window_start
+
+            request_messages = messages[:1]
+            if history_summary:
+                summary = f"Summary of the conversation so far:\n{history_summary}"
+                summary_message: ChatCompletionMessageParam = {
+                    "role": "system",
+                    "content": summary,
+                }
+                request_messages.append(summary_message)
+            request_messages.extend(messages[summarized_until:])
+
+            stream = openai_client.chat.completions.create(
+                model=config.CONVERSATIONAL_MODELS["openai"],
+                messages=request_messages,
+                stream=True,
             )
 
-            # Fixed: Handle potential None value from response
-            bot_response = response.choices[0].message.content
-            if bot_response is None:
+            print("🤖 Cornelius: ", end="", flush=True)
+            chunks: list[str] = []
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    chunks.append(chunk.choices[0].delta.content)
+                    print(chunks[-1], end="", flush=True)
+            print()
+
+            # Handle an empty response
+            if not chunks:
                 print("Error: Model returned no response.")
                 break
 
-            print(f"🤖 Cornelius: {bot_response}")
+            bot_response = "".join(chunks)
             bot_message: ChatCompletionMessageParam = {
                 "role": "assistant",
                 "content": bot_response,
@@ -176,6 +269,7 @@ def run_conversation():
 
     # Once the loop breaks, generate and save the summary
     summarize_and_save(messages, openai_client, pro_ctcae_mapper)
+    data_writer.flush()
 
 
 if __name__ == "__main__":
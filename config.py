@@ -2,8 +2,26 @@
 # The specific Hugging Face model we'll use for Named Entity Recognition (NER)
 NER_MODEL_NAME = "samrawal/bert-base-uncased_clinical-ner"
 
-# The OpenAI model for generating conversational responses and the final JSON summary
-CONVERSATIONAL_MODEL = "claude-opus-4-1"
+# Where the INT8-quantized ONNX export of the NER model is kept. When optimum's
+# ONNX Runtime extras are installed the model is exported here on first load and
+# run with ONNX Runtime; otherwise (or when set to None) the PyTorch model is used
+NER_ONNX_DIR = "models/ner-onnx-int8"
+
+# PyTorch threads for NER inference. None keeps PyTorch's default of one per
+# physical core, which suits a single process; when several server workers share
+# the CPU, set this to roughly cores / workers so they don't oversubscribe it
+NER_NUM_THREADS = None
+
+# The LLM provider used by the API server and summary worker: "anthropic" or
+# "openai". The LLM_BACKEND environment variable (or .env entry) overrides it
+LLM_BACKEND = "anthropic"
+
+# The model for generating conversational responses and the final JSON summary,
+# for each backend. The CLI (app.py) always talks to OpenAI
+CONVERSATIONAL_MODELS = {
+    "anthropic": "claude-opus-4-1",
+    "openai": "gpt-4o",
+}
 
 # --- Prompts ---
 
@@ -38,3 +56,22 @@ into a single, clean JSON object. The JSON should contain the following keys:
 
 Only output the raw JSON object and nothing else.
 """
+
+# --- CLI Context Window ---
+
+# Most recent messages the CLI sends verbatim with each turn. When the history
+# grows past this, older turns are folded into a running summary so each request
+# stays a bounded size (the final JSON extraction still sees the full history)
+CONTEXT_WINDOW_MESSAGES = 16
+
+# The cheaper OpenAI model used to maintain that running summary
+HISTORY_SUMMARY_MODEL = "gpt-4o-mini"
+
+# Instruction for folding older turns into the running summary.
+HISTORY_SUMMARY_PROMPT = """
+You maintain a running summary of a conversation between 'Cornelius', an assistant
+preparing a cancer patient for an exam with IV contrast dye, and the patient.
+Merge the new turns into the existing summary. Keep every medical detail the patient
+shared: previous reactions, kidney problems or diabetes, Metformin use, symptoms and
+their severity, and concerns. Reply with the updated summary only.
+"""
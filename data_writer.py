@@ -0,0 +1,34 @@
+"""
+Background data file writes
+Patient summary and PRO-CTCAE files are written on a small thread pool so
+callers can move on (or map the next file) without waiting on the disk
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+
+_io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="data-writer")
+
+# Writes that haven't finished yet, so flush() can wait for them
+_pending: set[Future] = set()
+
+
+def _report_write_error(future: Future) -> None:
+    """Forget a finished write and log it if it failed"""
+    _pending.discard(future)
+    error = future.exception()
+    if error:
+        print(f"❌ Error writing data file: {error}")
+
+
+def write_in_background(file_name: str, data: bytes) -> Future:
+    """Queue a data file write on the background IO pool"""
+    future = _io_pool.submit(Path(file_name).write_bytes, data)
+    _pending.add(future)
+    future.add_done_callback(_report_write_error)
+    return future
+
+
+def flush() -> None:
+    """Wait for every queued data file write to finish"""
+    wait(list(_pending))
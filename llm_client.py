@@ -0,0 +1,163 @@
+"""
+Provider-agnostic LLM client
+Wraps the Anthropic and OpenAI SDKs behind one interface so the API server
+and summary worker don't depend on a specific provider. SDK clients are
+built on a shared, pooled HTTP client so connections (and their TLS
+sessions) are reused across requests
+"""
+
+import os
+from typing import TYPE_CHECKING, Iterator, Protocol
+
+import httpx
+from anthropic import Anthropic
+from anthropic.types import MessageParam
+
+import config
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+# Connection pool sizing for a single worker process
+MAX_CONNECTIONS = 200
+MAX_KEEPALIVE_CONNECTIONS = 100
+
+# Long enough for a full non-streamed summary, matching the gunicorn timeout
+REQUEST_TIMEOUT = httpx.Timeout(120.0, connect=5.0)
+
+
+def create_http_client() -> httpx.Client:
+    """Create an HTTP/2 client with a keep-alive connection pool"""
+    return httpx.Client(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        ),
+        timeout=REQUEST_TIMEOUT,
+    )
+
+
+def create_anthropic_client(http_client: httpx.Client | None = None) -> Anthropic:
+    """Create an Anthropic client (reads ANTHROPIC_API_KEY)"""
+    return Anthropic(http_client=http_client or create_http_client())
+
+
+def create_openai_client(http_client: httpx.Client | None = None) -> "OpenAI":
+    """Create an OpenAI client (reads OPENAI_API_KEY)"""
+    # Imported on first use so the Anthropic backend doesn't pay for loading it
+    from openai import OpenAI
+
+    return OpenAI(http_client=http_client or create_http_client())
+
+
+class LLMClient(Protocol):
+    """A chat model with a fixed system prompt that takes a conversation"""
+
+    def complete(self, messages: list[MessageParam], *, max_tokens: int) -> str:
+        """Return the model's full response text"""
+        ...
+
+    def stream(self, messages: list[MessageParam], *, max_tokens: int) -> Iterator[str]:
+        """Yield the model's response text as it is generated"""
+        ...
+
+
+class AnthropicAdapter:
+    """LLMClient backed by the Anthropic Messages API"""
+
+    def __init__(
+        self, model: str, system: str, client: Anthropic | None = None
+    ) -> None:
+        self.model = model
+        self.system = system
+        self.client = client or create_anthropic_client()
+
+    def complete(self, messages: list[MessageParam], *, max_tokens: int) -> str:
+        response = self.client.messages.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            system=self.system,
+        )
+
+        if not response.content:
+            raise ValueError("Model returned no content")
+
+        first_block = response.content[0]
+        if not hasattr(first_block, "text"):
+            raise ValueError("Model response did not contain text content")
+
+        return str(first_block.text)
+
+    def stream(self, messages: list[MessageParam], *, max_tokens: int) -> Iterator[str]:
+        with self.client.messages.stream(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            system=self.system,
+        ) as stream:
+            yield from stream.text_stream
+
+
+class OpenAIAdapter:
+    """LLMClient backed by the OpenAI Chat Completions API"""
+
+    def __init__(self, model: str, system: str, client: "OpenAI | None" = None) -> None:
+        self.model = model
+        # OpenAI takes the system prompt as the first message
+        self.system_message = {"role": "system", "content": system}
+        self.client = client or create_openai_client()
+
+    def _with_system(self, messages: list[MessageParam]) -> list:
+        return [self.system_message, *messages]
+
+    def complete(self, messages: list[MessageParam], *, max_tokens: int) -> str:
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._with_system(messages),
+            max_completion_tokens=max_tokens,
+        )
+
+        content = response.choices[0].message.content
+        if content is None:
+            raise ValueError("Model returned no content")
+
+        return content
+
+    def stream(self, messages: list[MessageParam], *, max_tokens: int) -> Iterator[str]:
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._with_system(messages),
+            max_completion_tokens=max_tokens,
+            stream=True,
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+def get_llm_backend() -> str:
+    """The LLM_BACKEND environment variable, falling back to config.LLM_BACKEND"""
+    # Read per call rather than at import, so a .env loaded later still applies
+    return os.environ.get("LLM_BACKEND") or config.LLM_BACKEND
+
+
+def create_llm_client(backend: str | None = None) -> LLMClient:
+    """
+    Create the LLM client for the configured backend ("anthropic" or "openai"),
+    using that backend's model from config.CONVERSATIONAL_MODELS
+    """
+    backend = backend or get_llm_backend()
+
+    if backend == "anthropic":
+        return AnthropicAdapter(
+            model=config.CONVERSATIONAL_MODELS["anthropic"],
+            system=config.SYSTEM_PROMPT,
+        )
+    if backend == "openai":
+        return OpenAIAdapter(
+            model=config.CONVERSATIONAL_MODELS["openai"], system=config.SYSTEM_PROMPT
+        )
+
+    raise ValueError(f"Unknown LLM backend: {backend}")
@@ -1,21 +1,52 @@
+import os
+import re
+import shutil
+import tempfile
+from collections import OrderedDict
+import torch
 from transformers import TokenClassificationPipeline, pipeline, AutoTokenizer, AutoModelForTokenClassification
 import logging
 
 # Configure logging to suppress verbose outputs from transformers
 logging.basicConfig(level=logging.ERROR)
 
+# Number of recent inputs whose entities are kept, so repeated answers
+# ("itching", "no") skip the model
+ENTITY_CACHE_SIZE = 128
+
+# Texts per forward pass when several inputs are extracted together
+NER_BATCH_SIZE = 8
+
+# Inputs longer than this are split into sentences and batched, keeping each
+# model input short. Shorter inputs are passed whole so the model sees full context
+LONG_INPUT_CHARS = 1000
+SENTENCE_BOUNDARY_RE = re.compile(r"(?<=[.!?])\s+")
+
+# File name ORTQuantizer gives the quantized model
+QUANTIZED_MODEL_FILE = "model_quantized.onnx"
+
 class NERExtractor:
     """A class to handle Named Entity Recognition using a ClinicalBERT model."""
-    def __init__(self, model_name: str) -> None:
+    def __init__(self, model_name: str, onnx_dir: str | None = None, num_threads: int | None = None) -> None:
         self.model_name: str = model_name
+        self.onnx_dir: str | None = onnx_dir
+        if num_threads:
+            # Intra-op threads for PyTorch inference (process-wide)
+            torch.set_num_threads(num_threads)
         self.pipeline: TokenClassificationPipeline | None = self._load_model()
+        self._cache: OrderedDict[str, dict[str, list[str]]] = OrderedDict()
 
     def _load_model(self):
         """Loads the NER model and tokenizer from Hugging Face."""
         print(f"Loading NER model: '{self.model_name}'... (This may take a moment)")
         try:
-            tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            model = AutoModelForTokenClassification.from_pretrained(self.model_name)
+            # The Rust-backed fast tokenizer; the pure-Python one is several times slower
+            tokenizer = AutoTokenizer.from_pretrained(self.model_name, use_fast=True)
+            if not tokenizer.is_fast:
+                print(f"Warning: no fast tokenizer for '{self.model_name}', NER will be slower.")
+            model = self._load_onnx_model(self.onnx_dir) if self.onnx_dir else None
+            if model is None:
+                model = AutoModelForTokenClassification.from_pretrained(self.model_name)
             # We use aggregation_strategy="simple" to automatically group B- and I- tags.
             # For example, "shortness", "of", "breath" will be grouped into one entity.
             # Note: Using "token-classification" task instead of "ner" for proper typing
@@ -23,36 +54,129 @@ class NERExtractor:
                 "token-classification",  # Fixed: Changed from "ner" to "token-classification"
                 model=model,
                 tokenizer=tokenizer,
-                aggregation_strategy="simple"
+                aggregation_strategy="simple",
+                framework="pt",
+                device=-1,  # CPU
             )
         except Exception as e:
             print(f"Error loading NER model: {e}")
             return None
 
+    def _load_onnx_model(self, onnx_dir: str):
+        """Loads the INT8-quantized ONNX model, exporting and quantizing it on first use."""
+        try:
+            # Optional dependency: pip install "optimum[onnxruntime]"
+            from optimum.onnxruntime import ORTModelForTokenClassification, ORTQuantizer
+            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        except ImportError:
+            print("ONNX Runtime not installed, using the PyTorch NER model.")
+            return None
+
+        try:
+            model_path = os.path.join(onnx_dir, QUANTIZED_MODEL_FILE)
+            if not os.path.exists(model_path):
+                print(f"Exporting '{self.model_name}' to ONNX with INT8 weights...")
+                # Export into a temporary directory and rename it into place, so other
+                # workers exporting at the same time never load a half-written model
+                # and a crash mid-export leaves nothing at onnx_dir to be reused
+                parent_dir = os.path.dirname(os.path.abspath(onnx_dir))
+                os.makedirs(parent_dir, exist_ok=True)
+                export_dir = tempfile.mkdtemp(prefix=".onnx-export-", dir=parent_dir)
+                try:
+                    onnx_model = ORTModelForTokenClassification.from_pretrained(self.model_name, export=True)
+                    quantizer = ORTQuantizer.from_pretrained(onnx_model)
+                    # Dynamic quantization: INT8 weights, activations quantized at runtime
+                    quantization_config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+                    quantizer.quantize(save_dir=export_dir, quantization_config=quantization_config)
+                    try:
+                        os.replace(export_dir, onnx_dir)
+                    except OSError:
+                        # Another worker moved its export into place first; use that one
+                        if not os.path.exists(model_path):
+                            raise
+                finally:
+                    shutil.rmtree(export_dir, ignore_errors=True)
+
+            return ORTModelForTokenClassification.from_pretrained(onnx_dir, file_name=QUANTIZED_MODEL_FILE)
+        except Exception as e:
+            print(f"Error loading ONNX NER model, using the PyTorch model: {e}")
+            return None
+
     def extract_entities(self, text: str) -> dict[str, list[str]]:
         """
         Extracts medical entities from a given text and returns them as a dictionary.
         """
+        return self.extract_entities_batch([text])[0]
+
+    def extract_entities_batch(self, texts: list[str]) -> list[dict[str, list[str]]]:
+        """
+        Extracts medical entities from several texts with a single batched model call.
+        Returns one dictionary per text, in the same order.
+        """
         if not self.pipeline:
-            return { "error": ["NER model not loaded."]}
+            return [{ "error": ["NER model not loaded."]} for _ in texts]
 
-        try:
-            ner_results = self.pipeline(text)
+        # Only surrounding whitespace is normalized; case can change the model's output
+        keys = [text.strip() for text in texts]
+        results: dict[str, dict[str, list[str]]] = {}
+        for key in keys:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                results[key] = cached
+
+        pending = [key for key in dict.fromkeys(keys) if key not in results]
+        segments = {key: self._split_long_input(key) for key in pending}
+        model_inputs = [segment for key in pending for segment in segments[key]]
+
+        if model_inputs:
+            try:
+                ner_results = self.pipeline(model_inputs, batch_size=NER_BATCH_SIZE)
+            except Exception as e:
+                print(f"Error during entity extraction: {e}")
+                ner_results = None
+
+            position = 0
+            for key in pending:
+                if ner_results is None:
+                    # Failed extractions are returned empty and not cached
+                    results[key] = {}
+                    continue
 
-            # Organize entities by their type (e.g., "DISEASE", "CHEMICAL")
-            extracted_data: dict[str, list[str]] = {}
+                count = len(segments[key])
+                results[key] = self._group_entities(ner_results[position:position + count])
+                position += count
+
+                self._cache[key] = results[key]
+                if len(self._cache) > ENTITY_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+
+        # Return copies so callers can't mutate the cached results
+        return [
+            {entity_type: list(values) for entity_type, values in results[key].items()}
+            for key in keys
+        ]
+
+    def _split_long_input(self, text: str) -> list[str]:
+        """Splits text longer than LONG_INPUT_CHARS into sentences."""
+        if len(text) <= LONG_INPUT_CHARS:
+            return [text]
+        return [sentence for sentence in SENTENCE_BOUNDARY_RE.split(text) if sentence]
+
+    def _group_entities(self, segment_results: list[list[dict]]) -> dict[str, list[str]]:
+        """Organizes pipeline output for one text by entity type."""
+        # Organize entities by their type (e.g., "DISEASE", "CHEMICAL")
+        extracted_data: dict[str, list[str]] = {}
+        seen: set[tuple[str, str]] = set()
+        for ner_results in segment_results:
             for entity in ner_results:
                 entity_type = entity['entity_group']
                 entity_value = entity['word']
 
-                if entity_type not in extracted_data:
-                    extracted_data[entity_type] = []
-
-                # Avoid duplicates
-                if entity_value not in extracted_data[entity_type]:
-                    extracted_data[entity_type].append(entity_value)
+                # Avoid duplicates (a set lookup; the lists keep first-seen order)
+                if (entity_type, entity_value) in seen:
+                    continue
+                seen.add((entity_type, entity_value))
+                extracted_data.setdefault(entity_type, []).append(entity_value)
 
-            return extracted_data
-        except Exception as e:
-            print(f"Error during entity extraction: {e}")
-            return {}
+        return extracted_data
@@ -3,11 +3,17 @@ PRO-CTCAE Symptom Mapper
 Maps patient-reported symptoms from conversation JSON to PRO-CTCAE codes
 """
 
-import json
+import functools
 import os
+import re
+from concurrent.futures import Future, ProcessPoolExecutor
 from dataclasses import dataclass
 from enum import Enum
-from typing import Any
+from typing import Any, Optional
+
+import orjson
+
+import data_writer
 
 
 class Severity(Enum):
@@ -40,7 +46,71 @@ class Interference(Enum):
     VERY_MUCH = 4
 
 
-@dataclass
+# Display labels for each level value (e.g. 4 -> "Almost Constantly")
+SEVERITY_LABELS = {m.value: m.name.replace("_", " ").title() for m in Severity}
+FREQUENCY_LABELS = {m.value: m.name.replace("_", " ").title() for m in Frequency}
+INTERFERENCE_LABELS = {m.value: m.name.replace("_", " ").title() for m in Interference}
+
+# Timestamp in a patient summary file name (patient_summary_YYYYMMDD_HHMMSS.json)
+SUMMARY_TIMESTAMP_RE = re.compile(r"patient_summary_(\d{8}_\d{6})\.json")
+
+# Below this many files, process_all_patient_files runs in-process, since
+# starting worker processes costs more than mapping a handful of files
+PARALLEL_MIN_FILES = 16
+
+# Severity words looked for in the full summary
+SEVERITY_KEYWORDS: dict[str, int] = {
+    "mild": Severity.MILD.value,
+    "moderate": Severity.MODERATE.value,
+    "severe": Severity.SEVERE.value,
+    "very severe": Severity.VERY_SEVERE.value,
+    "slight": Severity.MILD.value,
+    "bad": Severity.MODERATE.value,
+    "terrible": Severity.SEVERE.value,
+    "terribly": Severity.SEVERE.value,
+    "extreme": Severity.VERY_SEVERE.value,
+}
+
+# Matches any severity word as a whole word, in one pass over the text, along
+# with its adverb ("severely", "mildly", "badly"); the keyword is captured.
+# Longer phrases come first so "very severe" isn't read as "severe"
+SEVERITY_KEYWORD_RE = re.compile(
+    r"\b("
+    + "|".join(re.escape(k) for k in sorted(SEVERITY_KEYWORDS, key=len, reverse=True))
+    + r")(?:ly)?\b"
+)
+
+# Symptoms estimated as moderate when the patient had a previous reaction
+CRITICAL_SYMPTOMS = frozenset(
+    {
+        "shortness_of_breath",
+        "chest_tightness",
+        "throat_swelling",
+    }
+)
+
+
+@functools.lru_cache(maxsize=1)
+def _summary_severity(full_summary: str) -> int | None:
+    """
+    Highest severity named in a (lowercased) summary, or None
+
+    >>> _summary_severity("patient had severely itchy hives")
+    3
+    >>> _summary_severity("mildly itchy, and moderately swollen")
+    2
+    >>> _summary_severity("no reaction reported") is None
+    True
+    """
+    # Every symptom of a patient is estimated against the same summary, so the
+    # one-entry cache means it is scanned once per patient
+    matches = SEVERITY_KEYWORD_RE.findall(full_summary)
+    if not matches:
+        return None
+    return max(SEVERITY_KEYWORDS[keyword] for keyword in matches)
+
+
+@dataclass(slots=True)
 class ProCtcaeItem:
     """Represents a PRO-CTCAE item with its attributes"""
 
@@ -50,7 +120,7 @@ class ProCtcaeItem:
     description: str
 
 
-@dataclass
+@dataclass(slots=True)
 class ProCtcaeEntry:
     """Represents a patient's PRO-CTCAE entry"""
 
@@ -63,159 +133,170 @@ class ProCtcaeEntry:
     raw_text: str | None = None  # Original patient-reported text
 
 
+# Define PRO-CTCAE items relevant to contrast reactions
+PRO_CTCAE_ITEMS: dict[str, ProCtcaeItem] = {
+    # Cutaneous symptoms
+    "hives": ProCtcaeItem(
+        symptom_term="Hives",
+        code="PRO-CTCAE_hives",
+        attributes=["Presence"],
+        description="Hives (urticaria)",
+    ),
+    "itching": ProCtcaeItem(
+        symptom_term="Itching",
+        code="PRO-CTCAE_itching",
+        attributes=["Severity"],
+        description="Pruritus (itching)",
+    ),
+    "rash": ProCtcaeItem(
+        symptom_term="Rash",
+        code="PRO-CTCAE_rash",
+        attributes=["Presence"],
+        description="Skin rash",
+    ),
+    "skin_redness": ProCtcaeItem(
+        symptom_term="Skin redness",
+        code="PRO-CTCAE_erythema",
+        attributes=["Presence"],
+        description="Erythema or skin redness",
+    ),
+    # Respiratory symptoms
+    "shortness_of_breath": ProCtcaeItem(
+        symptom_term="Shortness of breath",
+        code="PRO-CTCAE_dyspnea",
+        attributes=["Severity", "Interference"],
+        description="Dyspnea (shortness of breath)",
+    ),
+    "wheezing": ProCtcaeItem(
+        symptom_term="Wheezing",
+        code="PRO-CTCAE_wheezing",
+        attributes=["Severity"],
+        description="Wheezing",
+    ),
+    "cough": ProCtcaeItem(
+        symptom_term="Cough",
+        code="PRO-CTCAE_cough",
+        attributes=["Severity", "Interference"],
+        description="Cough",
+    ),
+    # Circulatory symptoms
+    "swelling": ProCtcaeItem(
+        symptom_term="Swelling",
+        code="PRO-CTCAE_swelling",
+        attributes=["Frequency", "Severity", "Interference"],
+        description="Edema (swelling)",
+    ),
+    "heart_palpitations": ProCtcaeItem(
+        symptom_term="Heart palpitations",
+        code="PRO-CTCAE_palpitations",
+        attributes=["Frequency", "Severity"],
+        description="Heart palpitations",
+    ),
+    # Gastrointestinal symptoms
+    "nausea": ProCtcaeItem(
+        symptom_term="Nausea",
+        code="PRO-CTCAE_nausea",
+        attributes=["Frequency", "Severity"],
+        description="Nausea",
+    ),
+    "vomiting": ProCtcaeItem(
+        symptom_term="Vomiting",
+        code="PRO-CTCAE_vomiting",
+        attributes=["Frequency", "Severity"],
+        description="Vomiting",
+    ),
+    # General symptoms
+    "chills": ProCtcaeItem(
+        symptom_term="Chills",
+        code="PRO-CTCAE_chills",
+        attributes=["Frequency", "Severity"],
+        description="Chills",
+    ),
+    "dizziness": ProCtcaeItem(
+        symptom_term="Dizziness",
+        code="PRO-CTCAE_dizziness",
+        attributes=["Severity", "Interference"],
+        description="Dizziness",
+    ),
+    "headache": ProCtcaeItem(
+        symptom_term="Headache",
+        code="PRO-CTCAE_headache",
+        attributes=["Frequency", "Severity", "Interference"],
+        description="Headache",
+    ),
+    "anxiety": ProCtcaeItem(
+        symptom_term="Anxious",
+        code="PRO-CTCAE_anxiety",
+        attributes=["Frequency", "Severity", "Interference"],
+        description="Anxiety",
+    ),
+    "chest_tightness": ProCtcaeItem(
+        symptom_term="Chest pain",
+        code="PRO-CTCAE_chest_pain",
+        attributes=["Frequency", "Severity", "Interference"],
+        description="Chest tightness or pain",
+    ),
+}
+
+# Symptom mapping dictionary (maps various terms to standardized keys)
+SYMPTOM_MAPPINGS: dict[str, str] = {
+    # Hives variations
+    "hives": "hives",
+    "urticaria": "hives",
+    "welts": "hives",
+    # Itching variations
+    "itching": "itching",
+    "itchy": "itching",
+    "pruritus": "itching",
+    "itch": "itching",
+    # Swelling variations
+    "swelling": "swelling",
+    "edema": "swelling",
+    "puffiness": "swelling",
+    "angioedema": "swelling",
+    "facial swelling": "swelling",
+    "throat swelling": "swelling",
+    # Breathing variations
+    "shortness of breath": "shortness_of_breath",
+    "difficulty breathing": "shortness_of_breath",
+    "breathlessness": "shortness_of_breath",
+    "dyspnea": "shortness_of_breath",
+    "trouble breathing": "shortness_of_breath",
+    # Wheezing
+    "wheezing": "wheezing",
+    "wheeze": "wheezing",
+    # Rash variations
+    "rash": "rash",
+    "skin reaction": "rash",
+    "eruption": "rash",
+    # Other symptoms
+    "nausea": "nausea",
+    "vomiting": "vomiting",
+    "dizziness": "dizziness",
+    "dizzy": "dizziness",
+    "headache": "headache",
+    "chest tightness": "chest_tightness",
+    "chest pain": "chest_tightness",
+    "anxiety": "anxiety",
+    "anxious": "anxiety",
+    "palpitations": "heart_palpitations",
+    "heart racing": "heart_palpitations",
+}
+
+
 class ProCtcaeMapper:
     """Maps patient symptoms to PRO-CTCAE codes"""
 
     def __init__(self):
-        # Define PRO-CTCAE items relevant to contrast reactions
-        self.pro_ctcae_items: dict[str, ProCtcaeItem] = {
-            # Cutaneous symptoms
-            "hives": ProCtcaeItem(
-                symptom_term="Hives",
-                code="PRO-CTCAE_hives",
-                attributes=["Presence"],
-                description="Hives (urticaria)",
-            ),
-            "itching": ProCtcaeItem(
-                symptom_term="Itching",
-                code="PRO-CTCAE_itching",
-                attributes=["Severity"],
-                description="Pruritus (itching)",
-            ),
-            "rash": ProCtcaeItem(
-                symptom_term="Rash",
-                code="PRO-CTCAE_rash",
-                attributes=["Presence"],
-                description="Skin rash",
-            ),
-            "skin_redness": ProCtcaeItem(
-                symptom_term="Skin redness",
-                code="PRO-CTCAE_erythema",
-                attributes=["Presence"],
-                description="Erythema or skin redness",
-            ),
-            # Respiratory symptoms
-            "shortness_of_breath": ProCtcaeItem(
-                symptom_term="Shortness of breath",
-                code="PRO-CTCAE_dyspnea",
-                attributes=["Severity", "Interference"],
-                description="Dyspnea (shortness of breath)",
-            ),
-            "wheezing": ProCtcaeItem(
-                symptom_term="Wheezing",
-                code="PRO-CTCAE_wheezing",
-                attributes=["Severity"],
-                description="Wheezing",
-            ),
-            "cough": ProCtcaeItem(
-                symptom_term="Cough",
-                code="PRO-CTCAE_cough",
-                attributes=["Severity", "Interference"],
-                description="Cough",
-            ),
-            # Circulatory symptoms
-            "swelling": ProCtcaeItem(
-                symptom_term="Swelling",
-                code="PRO-CTCAE_swelling",
-                attributes=["Frequency", "Severity", "Interference"],
-                description="Edema (swelling)",
-            ),
-            "heart_palpitations": ProCtcaeItem(
-                symptom_term="Heart palpitations",
-                code="PRO-CTCAE_palpitations",
-                attributes=["Frequency", "Severity"],
-                description="Heart palpitations",
-            ),
-            # Gastrointestinal symptoms
-            "nausea": ProCtcaeItem(
-                symptom_term="Nausea",
-                code="PRO-CTCAE_nausea",
-                attributes=["Frequency", "Severity"],
-                description="Nausea",
-            ),
-            "vomiting": ProCtcaeItem(
-                symptom_term="Vomiting",
-                code="PRO-CTCAE_vomiting",
-                attributes=["Frequency", "Severity"],
-                description="Vomiting",
-            ),
-            # General symptoms
-            "chills": ProCtcaeItem(
-                symptom_term="Chills",
-                code="PRO-CTCAE_chills",
-                attributes=["Frequency", "Severity"],
-                description="Chills",
-            ),
-            "dizziness": ProCtcaeItem(
-                symptom_term="Dizziness",
-                code="PRO-CTCAE_dizziness",
-                attributes=["Severity", "Interference"],
-                description="Dizziness",
-            ),
-            "headache": ProCtcaeItem(
-                symptom_term="Headache",
-                code="PRO-CTCAE_headache",
-                attributes=["Frequency", "Severity", "Interference"],
-                description="Headache",
-            ),
-            "anxiety": ProCtcaeItem(
-                symptom_term="Anxious",
-                code="PRO-CTCAE_anxiety",
-                attributes=["Frequency", "Severity", "Interference"],
-                description="Anxiety",
-            ),
-            "chest_tightness": ProCtcaeItem(
-                symptom_term="Chest pain",
-                code="PRO-CTCAE_chest_pain",
-                attributes=["Frequency", "Severity", "Interference"],
-                description="Chest tightness or pain",
-            ),
-        }
+        # The tables are built once at import and shared by every mapper
+        self.pro_ctcae_items: dict[str, ProCtcaeItem] = PRO_CTCAE_ITEMS
+        self.symptom_mappings: dict[str, str] = SYMPTOM_MAPPINGS
 
-        # Symptom mapping dictionary (maps various terms to standardized keys)
-        self.symptom_mappings: dict[str, str] = {
-            # Hives variations
-            "hives": "hives",
-            "urticaria": "hives",
-            "welts": "hives",
-            # Itching variations
-            "itching": "itching",
-            "itchy": "itching",
-            "pruritus": "itching",
-            "itch": "itching",
-            # Swelling variations
-            "swelling": "swelling",
-            "edema": "swelling",
-            "puffiness": "swelling",
-            "angioedema": "swelling",
-            "facial swelling": "swelling",
-            "throat swelling": "swelling",
-            # Breathing variations
-            "shortness of breath": "shortness_of_breath",
-            "difficulty breathing": "shortness_of_breath",
-            "breathlessness": "shortness_of_breath",
-            "dyspnea": "shortness_of_breath",
-            "trouble breathing": "shortness_of_breath",
-            # Wheezing
-            "wheezing": "wheezing",
-            "wheeze": "wheezing",
-            # Rash variations
-            "rash": "rash",
-            "skin reaction": "rash",
-            "eruption": "rash",
-            # Other symptoms
-            "nausea": "nausea",
-            "vomiting": "vomiting",
-            "dizziness": "dizziness",
-            "dizzy": "dizziness",
-            "headache": "headache",
-            "chest tightness": "chest_tightness",
-            "chest pain": "chest_tightness",
-            "anxiety": "anxiety",
-            "anxious": "anxiety",
-            "palpitations": "heart_palpitations",
-            "heart racing": "heart_palpitations",
-        }
+    def __reduce__(self):
+        # Pickle as a bare constructor call, so mappers sent to worker processes
+        # don't carry copies of the tables; workers use their own module-level
+        # tables (inherited copy-on-write when the pool forks)
+        return (ProCtcaeMapper, ())
 
     def normalize_symptom(self, symptom: str) -> str | None:
         """Normalize a symptom string to match PRO-CTCAE terminology"""
@@ -230,35 +311,16 @@ class ProCtcaeMapper:
         # Check if patient had a previous reaction (might indicate more severe)
         has_previous = context.get("has_previous_reaction", False)
 
-        # Default severity mappings based on common patterns
-        severity_keywords = {
-            "mild": Severity.MILD.value,
-            "moderate": Severity.MODERATE.value,
-            "severe": Severity.SEVERE.value,
-            "very severe": Severity.VERY_SEVERE.value,
-            "slight": Severity.MILD.value,
-            "bad": Severity.MODERATE.value,
-            "terrible": Severity.SEVERE.value,
-            "extreme": Severity.VERY_SEVERE.value,
-        }
-
         # Check full summary for severity indicators
-        full_summary = context.get("full_summary", "").lower()
-
-        for keyword, level in severity_keywords.items():
-            if keyword in full_summary:
-                return level
+        summary_level = _summary_severity(context.get("full_summary", "").lower())
+        if summary_level is not None:
+            return summary_level
 
         # Default severity based on symptom type and history
         if has_previous:
             # Previous reactions might be more severe
-            critical_symptoms = [
-                "shortness_of_breath",
-                "chest_tightness",
-                "throat_swelling",
-            ]
             normalized = self.normalize_symptom(symptom)
-            if normalized in critical_symptoms:
+            if normalized in CRITICAL_SYMPTOMS:
                 return Severity.MODERATE.value
             return Severity.MILD.value
 
@@ -266,11 +328,15 @@ class ProCtcaeMapper:
 
     def parse_patient_json(self, json_file_path: str) -> list[ProCtcaeEntry]:
         """Parse patient JSON file and extract PRO-CTCAE entries"""
-        entries = []
-
         # Load the JSON file
-        with open(json_file_path, "r") as f:
-            data = json.load(f)
+        with open(json_file_path, "rb") as f:
+            data = orjson.loads(f.read())
+
+        return self.parse_patient_dict(data)
+
+    def parse_patient_dict(self, data: dict[str, Any]) -> list[ProCtcaeEntry]:
+        """Extract PRO-CTCAE entries from already-loaded patient summary data"""
+        entries = []
 
         # Extract reported symptoms
         reported_symptoms = data.get("reported_symptoms", [])
@@ -352,21 +418,19 @@ class ProCtcaeMapper:
             if entry.severity is not None:
                 entry_dict["severity"] = {
                     "value": entry.severity,
-                    "label": Severity(entry.severity).name.replace("_", " ").title(),
+                    "label": SEVERITY_LABELS[entry.severity],
                 }
 
             if entry.frequency is not None:
                 entry_dict["frequency"] = {
                     "value": entry.frequency,
-                    "label": Frequency(entry.frequency).name.replace("_", " ").title(),
+                    "label": FREQUENCY_LABELS[entry.frequency],
                 }
 
             if entry.interference is not None:
                 entry_dict["interference"] = {
                     "value": entry.interference,
-                    "label": Interference(entry.interference)
-                    .name.replace("_", " ")
-                    .title(),
+                    "label": INTERFERENCE_LABELS[entry.interference],
                 }
 
             if entry.presence is not None:
@@ -415,54 +479,87 @@ class ProCtcaeMapper:
 
         return summary
 
-    def process_all_patient_files(
-        self, data_directory: str = "data"
-    ) -> list[dict[str, str]]:
+    def _process_patient_file(
+        self,
+        data_directory: str,
+        filename: str,
+        pending_writes: Optional[list[Future]] = None,
+    ) -> dict[str, Any]:
         """
-        Process all patient JSON files in the data directory
-        Returns a list of processed PRO-CTCAE data for each patient
+        Map one patient summary file and save its PRO-CTCAE file
+        If pending_writes is given, the file is written in the background and
+        the write's future is appended to it
         """
-        results = []
+        file_path = os.path.join(data_directory, filename)
 
-        # Get all JSON files in the data directory
-        json_files = [
-            f
-            for f in os.listdir(data_directory)
-            if f.startswith("patient_summary_") and f.endswith(".json")
-        ]
+        # Parse and extract PRO-CTCAE entries
+        entries = self.parse_patient_json(file_path)
 
-        for filename in json_files:
-            file_path = os.path.join(data_directory, filename)
-            print(f"\nProcessing: {filename}")
+        # Format for EHR
+        ehr_data = self.format_for_ehr_entry(entries)
 
-            # Parse and extract PRO-CTCAE entries
-            entries = self.parse_patient_json(file_path)
+        # Add metadata
+        ehr_data["source_file"] = filename
+        match = SUMMARY_TIMESTAMP_RE.match(filename)  # Extract timestamp from filename
+        ehr_data["assessment_date"] = match.group(1) if match else None
 
-            # Format for EHR
-            ehr_data = self.format_for_ehr_entry(entries)
+        # Generate summary
+        clinical_summary = self.generate_clinical_summary(entries)
+        ehr_data["clinical_summary"] = clinical_summary
 
-            # Add metadata
-            ehr_data["source_file"] = filename
-            ehr_data["assessment_date"] = filename.split("_")[2].split(".")[
-                0
-            ]  # Extract date from filename
+        # Save PRO-CTCAE formatted file
+        output_filename = filename.replace("patient_summary_", "pro_ctcae_")
+        output_path = os.path.join(data_directory, output_filename)
 
-            # Generate summary
-            clinical_summary = self.generate_clinical_summary(entries)
-            ehr_data["clinical_summary"] = clinical_summary
+        output = orjson.dumps(ehr_data, option=orjson.OPT_INDENT_2)
+        if pending_writes is not None:
+            pending_writes.append(data_writer.write_in_background(output_path, output))
+        else:
+            with open(output_path, "wb") as f:
+                f.write(output)
 
-            results.append(ehr_data)
+        return ehr_data
 
-            # Print summary
-            print(clinical_summary)
+    def process_all_patient_files(
+        self, data_directory: str = "data"
+    ) -> list[dict[str, str]]:
+        """
+        Process all patient JSON files in the data directory
+        Returns a list of processed PRO-CTCAE data for each patient
+        """
+        # Get all JSON files in the data directory (scandir reads the file type
+        # from the directory listing, so there's no stat per entry)
+        with os.scandir(data_directory) as dir_entries:
+            json_files = [
+                entry.name
+                for entry in dir_entries
+                if entry.is_file()
+                and entry.name.startswith("patient_summary_")
+                and entry.name.endswith(".json")
+            ]
 
-            # Save PRO-CTCAE formatted file
+        # Files are independent, so large batches are spread across processes.
+        # Worker processes write synchronously: they exit without waiting on threads
+        process_file = functools.partial(self._process_patient_file, data_directory)
+        if len(json_files) >= PARALLEL_MIN_FILES:
+            with ProcessPoolExecutor() as executor:
+                results = list(executor.map(process_file, json_files, chunksize=8))
+        else:
+            # In-process, each write overlaps with mapping the next file
+            pending_writes: list[Future] = []
+            results = [
+                process_file(filename, pending_writes) for filename in json_files
+            ]
+            data_writer.flush()
+            # A failed write raises here, as it does from the process pool, instead
+            # of its file being reported as saved
+            for write in pending_writes:
+                write.result()
+
+        for filename, ehr_data in zip(json_files, results):
+            print(f"\nProcessed: {filename}")
+            print(ehr_data["clinical_summary"])
             output_filename = filename.replace("patient_summary_", "pro_ctcae_")
-            output_path = os.path.join(data_directory, output_filename)
-
-            with open(output_path, "w") as f:
-                json.dump(ehr_data, f, indent=2)
-
             print(f"Saved PRO-CTCAE data to: {output_filename}")
 
         return results
@@ -497,7 +594,7 @@ def main():
         # Generate EHR-ready format
         ehr_data = mapper.format_for_ehr_entry(entries)
         print("\n=== EHR-Ready Format ===")
-        print(json.dumps(ehr_data, indent=2))
+        print(orjson.dumps(ehr_data, option=orjson.OPT_INDENT_2).decode())
 
     # Process all files in the data directory
     print("\n" + "=" * 50)
@@ -3,18 +3,23 @@ Utility script to process existing patient summary files and generate PRO-CTCAE
 Run this to batch process all your existing patient conversation JSONs
 """
 
+import functools
 import os
 import sys
-import json
-from pro_ctcae_mapper import ProCtcaeMapper
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+
+import orjson
+from pro_ctcae_mapper import PARALLEL_MIN_FILES, ProCtcaeMapper
 
 
 def process_single_file(
     mapper: ProCtcaeMapper, file_path: str, output_dir: str = "data"
-) -> bool:
+) -> tuple[bool, str]:
     """
     Process a single patient summary file
-    Returns True if successful, False otherwise
+    Returns (True if successful, report lines to print). Output is returned
+    rather than printed so reports from worker processes don't interleave
     """
     try:
         filename = os.path.basename(file_path)
@@ -23,8 +28,7 @@ def process_single_file(
         entries = mapper.parse_patient_json(file_path)
 
         if not entries:
-            print("  ⚠️  No symptoms found to map")
-            return False
+            return False, "  ⚠️  No symptoms found to map"
 
         # Format for EHR
         ehr_data = mapper.format_for_ehr_entry(entries)
@@ -44,17 +48,35 @@ def process_single_file(
         output_filename = filename.replace("patient_summary_", "pro_ctcae_")
         output_path = os.path.join(output_dir, output_filename)
 
-        with open(output_path, "w") as f:
-            json.dump(ehr_data, f, indent=2)
-
-        print(f"  ✅ PRO-CTCAE mapping saved to: {output_filename}")
-        print(f"  📊 Mapped {len(entries)} symptom(s)")
+        with open(output_path, "wb") as f:
+            f.write(orjson.dumps(ehr_data, option=orjson.OPT_INDENT_2))
 
-        return True
+        return True, (
+            f"  ✅ PRO-CTCAE mapping saved to: {output_filename}\n"
+            f"  📊 Mapped {len(entries)} symptom(s)"
+        )
 
     except Exception as e:
-        print(f"  ❌ Error processing file: {e}")
-        return False
+        return False, f"  ❌ Error processing file: {e}"
+
+
+def print_reports(
+    filenames: list[str], results: Iterable[tuple[bool, str]]
+) -> tuple[int, int]:
+    """
+    Print each file's report as its result arrives
+    Returns (successful, failed) counts
+    """
+    successful = 0
+    failed = 0
+    for filename, (success, report) in zip(filenames, results):
+        print(f"\n📄 Processing: {filename}")
+        print(report)
+        if success:
+            successful += 1
+        else:
+            failed += 1
+    return successful, failed
 
 
 def main():
@@ -70,12 +92,15 @@ def main():
     print("🔧 Initializing PRO-CTCAE mapper...")
     mapper = ProCtcaeMapper()
 
-    # Get all patient summary files
-    json_files = [
+    # Get all patient summary files, and the names already in data/ so existing
+    # PRO-CTCAE files are found without a stat per file
+    with os.scandir("data") as dir_entries:
+        existing_files = {entry.name for entry in dir_entries if entry.is_file()}
+    json_files = sorted(
         f
-        for f in os.listdir("data")
+        for f in existing_files
         if f.startswith("patient_summary_") and f.endswith(".json")
-    ]
+    )
 
     if not json_files:
         print("No patient summary files found in the data directory.")
@@ -84,29 +109,28 @@ def main():
     print(f"\n📁 Found {len(json_files)} patient summary file(s) to process.\n")
     print("=" * 60)
 
-    successful = 0
     skipped = 0
-    failed = 0
 
-    # Process each file
-    for filename in sorted(json_files):
-        file_path = os.path.join("data", filename)
-
-        # Check if PRO-CTCAE file already exists
+    # Skip files whose PRO-CTCAE file already exists
+    to_process = []
+    for filename in json_files:
         pro_ctcae_filename = filename.replace("patient_summary_", "pro_ctcae_")
-        pro_ctcae_path = os.path.join("data", pro_ctcae_filename)
-
-        print(f"\n📄 Processing: {filename}")
-
-        if os.path.exists(pro_ctcae_path):
-            print("  ⏭️  Skipping (PRO-CTCAE file already exists)")
+        if pro_ctcae_filename in existing_files:
+            print(f"\n📄 Skipping: {filename} (PRO-CTCAE file already exists)")
             skipped += 1
-            continue
-
-        if process_single_file(mapper, file_path):
-            successful += 1
         else:
-            failed += 1
+            to_process.append(filename)
+
+    # Files are independent, so large batches are spread across processes.
+    # Reports print in input order, so one may wait behind an earlier, slower file
+    process_file = functools.partial(process_single_file, mapper)
+    file_paths = [os.path.join("data", filename) for filename in to_process]
+    if len(file_paths) >= PARALLEL_MIN_FILES:
+        with ProcessPoolExecutor() as executor:
+            results = executor.map(process_file, file_paths, chunksize=4)
+            successful, failed = print_reports(to_process, results)
+    else:
+        successful, failed = print_reports(to_process, map(process_file, file_paths))
 
     # Print summary
     print("\n" + "=" * 60)
@@ -1,27 +1,98 @@
 import datetime
-import json
+import functools
 import os
+import socket
+import time
 import uuid
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
+import orjson
 from anthropic.types import MessageParam
-from redis import ConnectionError, Redis
+from redis import BlockingConnectionPool, ConnectionError, Redis, WatchError
+from redis.client import Pipeline
 
 # Redis configuration - can be overwritten via environment variables
 REDIS_URL = os.environ.get("REDIS_URL", "redis://:raecer123@localhost:6379/0")
 SESSION_TTL_HOURS = int(os.environ.get("SESSION_TTL_HOURS", "24"))
 
+# Sessions fetched per SSCAN/pipeline round trip when walking all sessions
+SCAN_BATCH_SIZE = 500
+
+# Connections per process; callers wait for a free one rather than opening more
+REDIS_POOL_SIZE = int(os.environ.get("REDIS_POOL_SIZE", "32"))
+
+# Sets meta fields (and appends a message) and refreshes the TTL only if the
+# meta hash still exists: HSET on an expired session would recreate a partial
+# one. KEYS: meta, messages. ARGV: ttl, message ("" for none), field/value pairs
+WRITE_EXISTING_SCRIPT = """
+if redis.call("EXISTS", KEYS[1]) == 0 then
+    return 0
+end
+if ARGV[2] ~= "" then
+    redis.call("RPUSH", KEYS[2], ARGV[2])
+end
+redis.call("HSET", KEYS[1], unpack(ARGV, 3))
+redis.call("EXPIRE", KEYS[1], ARGV[1])
+redis.call("EXPIRE", KEYS[2], ARGV[1])
+return 1
+"""
+
+# One pool per Redis URL, shared by every SessionManager in the process
+_connection_pools: dict[str, BlockingConnectionPool] = {}
+
+
+def get_connection_pool(redis_url: str) -> BlockingConnectionPool:
+    """Get the shared connection pool for a Redis URL, creating it on first use"""
+    pool = _connection_pools.get(redis_url)
+    if pool is None:
+        pool = BlockingConnectionPool.from_url(
+            redis_url,
+            max_connections=REDIS_POOL_SIZE,
+            decode_responses=True,
+            # Keep idle connections warm and check them before reuse
+            socket_keepalive=True,
+            socket_keepalive_options=(
+                {socket.TCP_KEEPIDLE: 60} if hasattr(socket, "TCP_KEEPIDLE") else {}
+            ),
+            health_check_interval=30,
+        )
+        _connection_pools[redis_url] = pool
+    return pool
+
+
+@functools.lru_cache(maxsize=1)
+def _iso_for_second(second: int) -> str:
+    """ISO timestamp for a Unix second, formatted once per second"""
+    return datetime.datetime.fromtimestamp(second).isoformat()
+
+
+def iso_timestamp() -> str:
+    """Current local time as an ISO string, at one-second resolution"""
+    return _iso_for_second(int(time.time()))
 
-@dataclass
+
+# Session attributes stored in the meta hash, one orjson-encoded value per
+# field. Messages are kept in their own list so appends never rewrite them
+SESSION_META_FIELDS = (
+    "status",
+    "created_at",
+    "updated_at",
+    "patient_data",
+    "pro_ctcae_data",
+    "error_message",
+)
+
+
+@dataclass(slots=True)
 class ConversationSession:
     """Represents a single conversation session"""
 
     session_id: str
     messages: List[MessageParam] = field(default_factory=list)
-    status: str = "active"  # active, completed, error
-    created_at: str = field(default_factory=lambda: datetime.datetime.now().isoformat())
-    updated_at: str = field(default_factory=lambda: datetime.datetime.now().isoformat())
+    status: str = "active"  # active, generating, completed, error
+    created_at: str = field(default_factory=iso_timestamp)
+    updated_at: str = field(default_factory=iso_timestamp)
     patient_data: Optional[dict] = None
     pro_ctcae_data: Optional[dict] = None
     error_message: Optional[str] = None
@@ -39,43 +110,37 @@ class ConversationSession:
             "error_message": self.error_message,
         }
 
-    def to_json(self):
-        """Serialize entire session to JSON format for Redis storage"""
-        return json.dumps(
-            {
-                "session_id": self.session_id,
-                "messages": self.messages,
-                "status": self.status,
-                "created_at": self.created_at,
-                "updated_at": self.updated_at,
-                "patient_data": self.patient_data,
-                "pro_ctcae_data": self.pro_ctcae_data,
-                "error_message": self.error_message,
-            }
-        )
+    def to_meta(self) -> dict[str, bytes]:
+        """Serialize everything but the messages for the Redis meta hash"""
+        return {name: orjson.dumps(getattr(self, name)) for name in SESSION_META_FIELDS}
 
     @classmethod
-    def from_json(cls, json_str: str) -> "ConversationSession":
-        """Deserialize session from JSON"""
-        data = json.loads(json_str)
+    def from_redis(
+        cls, session_id: str, meta: dict[str, str], messages: list[str]
+    ) -> "ConversationSession":
+        """Deserialize session from its meta hash and message list"""
         return cls(
-            session_id=data["session_id"],
-            messages=data["messages"],
-            status=data["status"],
-            created_at=data["created_at"],
-            updated_at=data["updated_at"],
-            patient_data=data["patient_data"],
-            pro_ctcae_data=data["pro_ctcae_data"],
-            error_message=data["error_message"],
+            session_id=session_id,
+            messages=[orjson.loads(message) for message in messages],
+            **{
+                name: orjson.loads(value)
+                for name, value in meta.items()
+                if name in SESSION_META_FIELDS
+            },
         )
 
 
 class SessionManager:
     """Manages multiple conversation sessions using Redis for persistence"""
 
-    # Redis key prefix for session data
+    # Redis key prefix for session data. Each session has a meta hash at
+    # {prefix}{id}:meta and a list of messages at {prefix}{id}:messages
     KEY_PREFIX = "raecer:session:"
 
+    # Set of session IDs, so listing never scans the whole keyspace. Entries for
+    # sessions that expired via TTL are removed the next time sessions are listed
+    INDEX_KEY = "raecer:sessions"
+
     def __init__(self, redis_url: Optional[str] = None):
         """
         Initialize the session manager with Redis connection.
@@ -84,8 +149,11 @@ class SessionManager:
             redis_url: Redis connection URL. Defaults to REDIS_URL env var or localhost.
         """
         self.redis_url = redis_url or REDIS_URL
-        self.redis_client = Redis.from_url(self.redis_url, decode_responses=True)
+        self.redis_client = Redis(connection_pool=get_connection_pool(self.redis_url))
         self.session_ttl = SESSION_TTL_HOURS * 3600  # Convert hours to seconds
+        self._write_existing_script = self.redis_client.register_script(
+            WRITE_EXISTING_SCRIPT
+        )
 
         # Test connection
         try:
@@ -102,14 +170,38 @@ class SessionManager:
             return f"redis://***@{parts[-1]}"
         return url
 
-    def _session_key(self, session_id: str) -> str:
-        """Generate Redis key for a session"""
-        return f"{self.KEY_PREFIX}{session_id}"
-
-    def _save_session(self, session: ConversationSession) -> None:
-        """Save session to Redis with TTL"""
-        key = self._session_key(session.session_id)
-        self.redis_client.setex(key, self.session_ttl, session.to_json())
+    def _meta_key(self, session_id: str) -> str:
+        """Generate Redis key for a session's meta hash"""
+        return f"{self.KEY_PREFIX}{session_id}:meta"
+
+    def _messages_key(self, session_id: str) -> str:
+        """Generate Redis key for a session's message list"""
+        return f"{self.KEY_PREFIX}{session_id}:messages"
+
+    def _refresh_ttl(self, pipe: Pipeline, session_id: str) -> None:
+        """Queue EXPIREs so both of a session's keys live for another full TTL"""
+        pipe.expire(self._meta_key(session_id), self.session_ttl)
+        pipe.expire(self._messages_key(session_id), self.session_ttl)
+
+    def _write_existing(
+        self,
+        session_id: str,
+        fields: dict[str, bytes],
+        message: Optional[MessageParam] = None,
+    ) -> bool:
+        """
+        Set meta fields (and append a message) atomically, refreshing the TTL,
+        in one round trip
+        Returns False without writing if the session has expired
+        """
+        keys = [self._meta_key(session_id), self._messages_key(session_id)]
+        args: list[str | int | bytes] = [
+            self.session_ttl,
+            orjson.dumps(message) if message is not None else b"",
+        ]
+        for name, value in fields.items():
+            args += [name, value]
+        return bool(self._write_existing_script(keys=keys, args=args))
 
     def create_session(
         self, initial_message: Optional[MessageParam] = None
@@ -118,80 +210,149 @@ class SessionManager:
         session_id = str(uuid.uuid4())
         session = ConversationSession(session_id=session_id)
 
+        pipe = self.redis_client.pipeline()
+        pipe.hset(self._meta_key(session_id), mapping=session.to_meta())
         if initial_message:
             session.messages.append(initial_message)
-
-        self._save_session(session)
+            pipe.rpush(self._messages_key(session_id), orjson.dumps(initial_message))
+        self._refresh_ttl(pipe, session_id)
+        pipe.sadd(self.INDEX_KEY, session_id)
+        pipe.execute()
         return session
 
     def get_session(self, session_id: str) -> Optional[ConversationSession]:
         """Get a session by ID"""
-        key = self._session_key(session_id)
-        data = self.redis_client.get(key)
+        pipe = self.redis_client.pipeline()
+        pipe.hgetall(self._meta_key(session_id))
+        pipe.lrange(self._messages_key(session_id), 0, -1)
+        meta, messages = pipe.execute()
 
-        if data is None:
+        if not meta:
             return None
 
-        return ConversationSession.from_json(data)
+        return ConversationSession.from_redis(session_id, meta, messages)
 
     def update_session(self, session_id: str, **kwargs) -> bool:
         """Update session attributes"""
-        session = self.get_session(session_id)
-        if not session:
-            return False
-
-        for key, value in kwargs.items():
-            if hasattr(session, key):
-                setattr(session, key, value)
+        # Only the changed fields are written; the message list is untouched
+        fields = {
+            name: orjson.dumps(value)
+            for name, value in kwargs.items()
+            if name in SESSION_META_FIELDS
+        }
+        fields["updated_at"] = orjson.dumps(iso_timestamp())
+        return self._write_existing(session_id, fields)
 
-        session.updated_at = datetime.datetime.now().isoformat()
-        self._save_session(session)
-        return True
+    def start_summary(self, session_id: str) -> bool:
+        """
+        Atomically move a session to "generating"
+        Returns False if the session is missing or already generating or
+        completed, so concurrent callers can't both queue a summary
+        """
+        meta_key = self._meta_key(session_id)
+        with self.redis_client.pipeline() as pipe:
+            while True:
+                try:
+                    # The transaction fails if the meta hash changes after WATCH
+                    pipe.watch(meta_key)
+                    status = pipe.hget(meta_key, "status")
+                    if status is None or orjson.loads(status) in (
+                        "generating",
+                        "completed",
+                    ):
+                        return False
+
+                    pipe.multi()
+                    pipe.hset(
+                        meta_key,
+                        mapping={
+                            "status": orjson.dumps("generating"),
+                            "updated_at": orjson.dumps(iso_timestamp()),
+                        },
+                    )
+                    self._refresh_ttl(pipe, session_id)
+                    pipe.execute()
+                    return True
+                except WatchError:
+                    continue
 
     def add_message(self, session_id: str, message: MessageParam) -> bool:
         """Add a message to a session's conversation history"""
-        session = self.get_session(session_id)
-        if not session:
-            return False
-
-        session.messages.append(message)
-        session.updated_at = datetime.datetime.now().isoformat()
-        self._save_session(session)
-        return True
+        fields = {"updated_at": orjson.dumps(iso_timestamp())}
+        return self._write_existing(session_id, fields, message)
 
     def append_message(
         self, session: ConversationSession, message: MessageParam
-    ) -> None:
-        """Append a message to an existing session object and save to Redis"""
+    ) -> bool:
+        """
+        Append a message to an existing session object and save to Redis
+        Returns False if the session expired in Redis since it was loaded
+        """
         session.messages.append(message)
-        session.updated_at = datetime.datetime.now().isoformat()
-        self._save_session(session)
+        session.updated_at = iso_timestamp()
+        fields = {"updated_at": orjson.dumps(session.updated_at)}
+        return self._write_existing(session.session_id, fields, message)
 
     def delete_session(self, session_id: str) -> bool:
         """Delete a session"""
-        key = self._session_key(session_id)
-        deleted = self.redis_client.delete(key)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.delete(self._meta_key(session_id), self._messages_key(session_id))
+        pipe.srem(self.INDEX_KEY, session_id)
+        deleted, _ = pipe.execute()
         return deleted > 0
 
+    def _iter_session_meta(self, *fields: str) -> Iterator[tuple[str, dict, int]]:
+        """
+        Yield (session ID, decoded meta fields, message count) for every
+        indexed session. Only the requested meta fields and the list lengths
+        are pipelined in batches; messages and patient data are never fetched
+        """
+        session_ids: list[str] = list(
+            self.redis_client.sscan_iter(self.INDEX_KEY, count=SCAN_BATCH_SIZE)
+        )
+
+        for start in range(0, len(session_ids), SCAN_BATCH_SIZE):
+            batch = session_ids[start : start + SCAN_BATCH_SIZE]
+            pipe = self.redis_client.pipeline(transaction=False)
+            for sid in batch:
+                pipe.hmget(self._meta_key(sid), fields)
+                pipe.llen(self._messages_key(sid))
+            results = pipe.execute()
+            metas, counts = results[::2], results[1::2]
+
+            # Every session has updated_at, so all-None means it expired via
+            # TTL; drop its index entry
+            expired_ids = [
+                sid
+                for sid, values in zip(batch, metas)
+                if all(value is None for value in values)
+            ]
+            if expired_ids:
+                self.redis_client.srem(self.INDEX_KEY, *expired_ids)
+
+            for sid, values, count in zip(batch, metas, counts):
+                if any(value is not None for value in values):
+                    meta = {
+                        name: orjson.loads(value) if value is not None else None
+                        for name, value in zip(fields, values)
+                    }
+                    yield sid, meta, count
+
     def list_sessions(self) -> List[dict]:
         """List all sessions (summary only)"""
-        pattern = f"{self.KEY_PREFIX}*"
-        keys: list[str] = self.redis_client.keys(pattern)  # ty:ignore[invalid-assignment]
-
         sessions = []
-        for key in keys:
-            data: str | None = self.redis_client.get(key)  # ty:ignore[invalid-assignment]
-            if data:
-                session = ConversationSession.from_json(data)
-                sessions.append(
-                    {
-                        "session_id": session.session_id,
-                        "status": session.status,
-                        "created_at": session.created_at,
-                        "updated_at": session.updated_at,
-                        "message_count": len(session.messages),
-                    }
-                )
+        for session_id, meta, message_count in self._iter_session_meta(
+            "status", "created_at", "updated_at"
+        ):
+            sessions.append(
+                {
+                    "session_id": session_id,
+                    "status": meta["status"],
+                    "created_at": meta["created_at"],
+                    "updated_at": meta["updated_at"],
+                    "message_count": message_count,
+                }
+            )
 
         return sessions
 
@@ -204,17 +365,20 @@ class SessionManager:
         """
         cutoff_time = datetime.datetime.now() - datetime.timedelta(hours=max_age_hours)
 
-        pattern = f"{self.KEY_PREFIX}*"
-        keys = self.redis_client.keys(pattern)
-
-        deleted_count = 0
-        for key in keys:
-            data = self.redis_client.get(key)
-            if data:
-                session = ConversationSession.from_json(data)
-                session_time = datetime.datetime.fromisoformat(session.updated_at)
-                if session_time < cutoff_time:
-                    self.redis_client.delete(key)
-                    deleted_count += 1
-
-        return deleted_count
+        expired_ids = []
+        for session_id, meta, _ in self._iter_session_meta("updated_at"):
+            session_time = datetime.datetime.fromisoformat(meta["updated_at"])
+            if session_time < cutoff_time:
+                expired_ids.append(session_id)
+
+        # Delete the sessions and their index entries in one pipelined round trip
+        pipe = self.redis_client.pipeline(transaction=False)
+        for sid in expired_ids:
+            pipe.delete(self._meta_key(sid), self._messages_key(sid))
+        if expired_ids:
+            pipe.srem(self.INDEX_KEY, *expired_ids)
+        results: list[int] = pipe.execute()
+
+        # Every DEL removes the meta hash and, if it has any, the message list;
+        # count sessions rather than keys
+        return sum(1 for deleted in results[: len(expired_ids)] if deleted)
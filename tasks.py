@@ -0,0 +1,200 @@
+"""
+Background jobs for the Raecer Bot API
+Summary generation runs in an RQ worker so API requests never wait on the
+extraction call, the data file writes, or the PRO-CTCAE mapping
+
+Start a worker with:
+    rq worker -w rq.worker.SimpleWorker --url $REDIS_URL summaries
+"""
+
+import os
+import time
+from typing import Optional
+
+import orjson
+from anthropic.types import MessageParam
+from dotenv import load_dotenv
+from pydantic import TypeAdapter, ValidationError
+from redis import Redis
+from rq import Queue
+from typing_extensions import TypedDict
+
+import config
+from data_writer import write_in_background
+from llm_client import LLMClient, create_llm_client
+from pro_ctcae_mapper import ProCtcaeMapper
+from session_manager import REDIS_URL, ConversationSession, SessionManager
+
+SUMMARY_QUEUE_NAME = "summaries"
+
+# Sent after the conversation to request the JSON summary. It must stay a user
+# turn: a trailing assistant message would be treated as a prefill
+EXTRACTION_MESSAGE: MessageParam = {
+    "role": "user",
+    "content": config.JSON_EXTRACTION_PROMPT,
+}
+
+
+class PatientSummary(TypedDict):
+    """Patient summary JSON requested by config.JSON_EXTRACTION_PROMPT"""
+
+    has_previous_reaction: bool
+    has_kidney_issues: bool
+    takes_metformin: bool
+    reported_symptoms: list[str]
+    patient_concerns: str
+    full_summary: str
+
+
+# Built once; decodes and validates the model's JSON in a single pass
+_patient_summary_adapter = TypeAdapter(PatientSummary)
+
+# Worker-side services, created on the first job so importing this module
+# from the API server stays cheap
+chat_client: Optional[LLMClient] = None
+pro_ctcae_mapper: Optional[ProCtcaeMapper] = None
+session_manager: Optional[SessionManager] = None
+
+
+def get_summary_queue(redis_url: Optional[str] = None) -> Queue:
+    """Create the RQ queue that summary jobs are enqueued on"""
+    # RQ stores pickled job data, so it needs a connection without decode_responses
+    connection = Redis.from_url(redis_url or REDIS_URL)
+    return Queue(SUMMARY_QUEUE_NAME, connection=connection)
+
+
+def summary_job_id(session_id: str) -> str:
+    """RQ job ID for a session's summary, so re-enqueueing is idempotent"""
+    return f"summary-{session_id}"
+
+
+def initialize_worker_services():
+    """Initialize LLM, PRO-CTCAE and session services once per worker"""
+    global chat_client, pro_ctcae_mapper, session_manager
+
+    load_dotenv()
+    if chat_client is None:
+        chat_client = create_llm_client()
+    if pro_ctcae_mapper is None:
+        pro_ctcae_mapper = ProCtcaeMapper()
+    if session_manager is None:
+        session_manager = SessionManager()
+
+
+def _strip_json_fence(text: str) -> str:
+    """Remove a leading ```json / ``` fence and a trailing ``` fence, if present"""
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+    elif text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+
+def generate_summary(
+    session: ConversationSession,
+) -> tuple[Optional[PatientSummary], Optional[dict], Optional[str]]:
+    """
+    Generate patient summary and PRO-CTCAE mapping from conversation history
+    Appends the extraction prompt to session.messages; the session is not saved
+    Returns: (patient_data, pro_ctcae_data, error_message)
+    """
+    try:
+        if not chat_client:
+            raise ValueError("LLM client not initialized")
+
+        if not pro_ctcae_mapper:
+            raise ValueError("PRO-CTCAE mapper not initialized")
+
+        # Add the extraction prompt. The session is this job's own copy and is
+        # never saved back, so append in place rather than copying the history
+        session.messages.append(EXTRACTION_MESSAGE)
+
+        # Get summary from the model
+        message_content = chat_client.complete(session.messages, max_tokens=2048)
+
+        # Parse and validate JSON
+        cleaned_json_string = _strip_json_fence(message_content)
+        patient_data = _patient_summary_adapter.validate_json(cleaned_json_string)
+
+        # Save patient data to file
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        os.makedirs("data", exist_ok=True)
+
+        file_name = f"data/patient_summary_{timestamp}.json"
+        write_in_background(
+            file_name, orjson.dumps(patient_data, option=orjson.OPT_INDENT_2)
+        )
+
+        # Generate PRO-CTCAE mapping
+        pro_ctcae_data = None
+        entries = pro_ctcae_mapper.parse_patient_dict(patient_data)
+
+        if entries:
+            ehr_data = pro_ctcae_mapper.format_for_ehr_entry(entries)
+            ehr_data["source_file"] = file_name
+            ehr_data["assessment_date"] = timestamp
+
+            clinical_summary = pro_ctcae_mapper.generate_clinical_summary(entries)
+            ehr_data["clinical_summary"] = clinical_summary
+
+            # Save PRO-CTCAE file
+            pro_ctcae_file = f"data/pro_ctcae_{timestamp}.json"
+            write_in_background(
+                pro_ctcae_file, orjson.dumps(ehr_data, option=orjson.OPT_INDENT_2)
+            )
+
+            pro_ctcae_data = ehr_data
+
+        return patient_data, pro_ctcae_data, None
+
+    except ValidationError as e:
+        return None, None, f"Invalid patient summary: {str(e)}"
+    except Exception as e:
+        return None, None, f"Error generating summary: {str(e)}"
+
+
+def summary_job_failed(job, connection, exc_type, exc_value, traceback) -> None:
+    """
+    RQ failure callback for generate_summary_job
+    Also runs when the worker died mid-job (OOM, SIGKILL, timeout) and RQ
+    cleans up the abandoned job, so the session never stays "generating" and
+    /end can retry it
+    """
+    manager = session_manager or SessionManager()
+    # Abandoned jobs fail with an AbandonedJobError that has no message
+    reason = str(exc_value) or exc_type.__name__
+    manager.update_session(
+        job.args[0], status="error", error_message=f"Summary job failed: {reason}"
+    )
+
+
+def generate_summary_job(session_id: str) -> None:
+    """
+    RQ job: generate the summary for a session and store the result on it
+    The session status moves from "generating" to "completed" or "error"
+    """
+    initialize_worker_services()
+    if not session_manager:
+        raise ValueError("Session manager not initialized")
+
+    session = session_manager.get_session(session_id)
+    if not session:
+        return
+
+    patient_data, pro_ctcae_data, error_message = generate_summary(session)
+
+    if error_message:
+        session_manager.update_session(
+            session_id, status="error", error_message=error_message
+        )
+        return
+
+    session_manager.update_session(
+        session_id,
+        status="completed",
+        patient_data=patient_data,
+        pro_ctcae_data=pro_ctcae_data,
+    )
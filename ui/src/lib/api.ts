@@ -24,6 +24,62 @@ export async function apiRequest<T>(
 	}
 }
 
+// Stream a message response from the server-sent events endpoint, calling
+// onDelta for each chunk of text and resolving with the final event
+export async function streamMessage(
+	sessionId: string,
+	message: string,
+	onDelta: (delta: string) => void
+): Promise<MessageStreamDone> {
+	const response = await fetch(`/api/conversation/${sessionId}/message/stream`, {
+		method: 'POST',
+		headers: { 'Content-Type': 'application/json' },
+		body: JSON.stringify({ message })
+	});
+	if (!response.ok || !response.body) {
+		throw new Error(`Request failed with status ${response.status}`);
+	}
+
+	const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+	let buffer = '';
+	while (true) {
+		const { value, done } = await reader.read();
+		if (done) break;
+
+		buffer += value;
+		const events = buffer.split('\n\n');
+		buffer = events.pop() ?? '';
+
+		for (const event of events) {
+			if (!event.startsWith('data: ')) continue;
+			const payload: MessageStreamEvent = JSON.parse(event.slice('data: '.length));
+			if ('error' in payload) throw new Error(payload.error);
+			if ('delta' in payload) onDelta(payload.delta);
+			if ('done' in payload) return payload;
+		}
+	}
+	throw new Error('Stream ended before the response completed');
+}
+
+// Poll the session status until the background summary job has finished
+export async function waitForSummary(
+	sessionId: string,
+	intervalMs = 1000
+): Promise<Summary> {
+	while (true) {
+		await new Promise((resolve) => setTimeout(resolve, intervalMs));
+		const { data } = await apiClient.get<SessionStatus>(
+			`/conversation/${sessionId}/status`
+		);
+		if (data.status === 'completed') {
+			return { patient_data: data.patient_data, pro_ctcae_data: data.pro_ctcae_data };
+		}
+		if (data.status === 'error') {
+			throw new Error(data.error_message ?? 'Summary generation failed');
+		}
+	}
+}
+
 // =============================
 //  API request/response types
 // =============================
@@ -40,6 +96,24 @@ export interface MessageResponse {
 	message_count: number;
 }
 
+export type MessageStreamDone = Omit<MessageResponse, 'response'> & { done: true };
+
+export type MessageStreamEvent =
+	| { delta: string }
+	| { error: string }
+	| MessageStreamDone;
+
+export interface SessionStatus {
+	session_id: string;
+	status: 'active' | 'generating' | 'completed' | 'error';
+	created_at: string;
+	updated_at: string;
+	message_count: number;
+	patient_data: PatientData;
+	pro_ctcae_data: ProCTCAEData;
+	error_message: string | null;
+}
+
 export interface Summary {
 	patient_data: PatientData;
 	pro_ctcae_data: ProCTCAEData;